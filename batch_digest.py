@@ -0,0 +1,389 @@
+"""
+Nightly batch digest generation for the Transformation Assistant.
+
+Builds the AI summary & guidance and the leadership script for every active
+project from its stored communications, and writes the results to disk so the
+Streamlit app can display them instantly.
+
+Project layout (one folder per project):
+
+    data/projects/<project-folder>/project.json      {"name", "type", "phase", "active"}
+    data/projects/<project-folder>/communications/   *.txt / *.md files
+
+Typical use (e.g. from cron every morning):
+
+    python batch_digest.py run --concurrency 4       # live, bounded concurrency
+    python batch_digest.py export batch_input.jsonl  # JSONL file for an offline batch endpoint
+    python batch_digest.py ingest batch_output.jsonl # load the batch results back in
+
+Every communication file is tracked in <digests-dir>/_state.json by name and
+content hash, so a file counts as new whenever its content has not been
+summarised before, whatever its modification time. Progress is checkpointed
+after every project, so an interrupted run can simply be started again and
+will resume where it stopped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+from prompts import leadership_script_request, summary_request
+
+PROJECTS_DIR = Path(os.environ.get("TA_PROJECTS_DIR", "data/projects"))
+DIGESTS_DIR = Path(os.environ.get("TA_DIGESTS_DIR", "digests"))
+STATE_FILE_NAME = "_state.json"
+COMMUNICATION_SUFFIXES = {".txt", ".md"}
+BATCH_ENDPOINT = "/v1/chat/completions"
+PARTS = ("summary", "script")
+
+
+# --------------------------------------------------------------------
+# STORAGE HELPERS
+# --------------------------------------------------------------------
+def project_key(project_name: str) -> str:
+    """
+    File-system friendly key for a project, shared with app.py for digest lookup.
+    A short hash of the full name keeps names that slugify alike (e.g. non-Latin
+    names) apart.
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", project_name.lower()).strip("-") or "project"
+    name_hash = hashlib.sha256(project_name.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}-{name_hash}"
+
+
+def _write_json(path: Path, data: dict) -> None:
+    # Write to a temp file first so a crash never leaves a half-written checkpoint
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _sha256(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def load_digest(project_name: str, digests_dir: Path = DIGESTS_DIR) -> dict | None:
+    """
+    Returns the stored digest for a project, or None if no batch run has produced one.
+    """
+    path = Path(digests_dir) / f"{project_key(project_name)}.json"
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def load_state(digests_dir: Path) -> dict:
+    path = digests_dir / STATE_FILE_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def load_projects(projects_dir: Path) -> list[dict]:
+    """
+    Reads every active project definition under projects_dir.
+    Raises ValueError if two active projects share a key (i.e. the same name).
+    """
+    projects = []
+    folders_by_key = {}
+    for meta_path in sorted(projects_dir.glob("*/project.json")):
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if not meta.get("active", True):
+            continue
+        name = meta.get("name") or meta_path.parent.name
+        key = project_key(name)
+        if key in folders_by_key:
+            raise ValueError(
+                f"Projects in {folders_by_key[key]} and {meta_path.parent} "
+                f"both map to key {key!r}; project names must be unique."
+            )
+        folders_by_key[key] = meta_path.parent
+        projects.append({
+            "key": key,
+            "name": name,
+            "type": meta.get("type", "Other"),
+            "phase": meta.get("phase", "Planning"),
+            "communications_dir": meta_path.parent / "communications",
+        })
+    return projects
+
+
+def gather_new_communications(project: dict, processed: dict) -> dict[str, str]:
+    """
+    Communication files whose content has not been summarised yet, as
+    {file name: text}. `processed` maps file names to the content hash
+    they had when they were last included in a digest.
+    """
+    comms_dir = project["communications_dir"]
+    if not comms_dir.is_dir():
+        return {}
+    new_files = {}
+    for path in sorted(comms_dir.iterdir()):
+        if not path.is_file() or path.suffix.lower() not in COMMUNICATION_SUFFIXES:
+            continue
+        text = path.read_text(encoding="utf-8", errors="replace")
+        if processed.get(path.name) != _sha256(text):
+            new_files[path.name] = text
+    return new_files
+
+
+def content_hash(project: dict, file_hashes: dict) -> str:
+    hasher = hashlib.sha256()
+    parts = [project["name"], project["type"], project["phase"]]
+    for name in sorted(file_hashes):
+        parts += [name, file_hashes[name]]
+    for part in parts:
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+# --------------------------------------------------------------------
+# JOB PLANNING
+# --------------------------------------------------------------------
+def plan_jobs(projects_dir: Path, state: dict) -> list[dict]:
+    """
+    Works out which projects need a fresh digest.
+    Projects whose communications have all been summarised already are skipped.
+    """
+    jobs = []
+    for project in load_projects(projects_dir):
+        processed = state.get(project["key"], {}).get("processed", {})
+        new_files = gather_new_communications(project, processed)
+        if not new_files:
+            print(f"skip {project['key']}: no new communications")
+            continue
+
+        file_hashes = {name: _sha256(text) for name, text in new_files.items()}
+        jobs.append({
+            "project": project,
+            "files": list(new_files),
+            "file_hashes": file_hashes,
+            "text": "\n\n".join(new_files.values()),
+            "content_hash": content_hash(project, file_hashes),
+        })
+    return jobs
+
+
+def build_requests(job: dict) -> dict:
+    project = job["project"]
+    args = (job["text"], project["name"], project["type"], project["phase"])
+    return {
+        "summary": summary_request(*args),
+        "script": leadership_script_request(*args),
+    }
+
+
+def write_digest(digests_dir: Path, job: dict, outputs: dict) -> None:
+    project = job["project"]
+    _write_json(digests_dir / f"{project['key']}.json", {
+        "project_name": project["name"],
+        "project_type": project["type"],
+        "phase": project["phase"],
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "content_hash": job["content_hash"],
+        "sources": job["files"],
+        "summary": outputs["summary"],
+        "script": outputs["script"],
+    })
+
+
+def mark_processed(state: dict, key: str, file_hashes: dict, digest_hash: str) -> None:
+    """
+    Records a finished digest: its files are no longer new, and any pending export is cleared.
+    """
+    project_state = state.setdefault(key, {})
+    project_state.setdefault("processed", {}).update(file_hashes)
+    project_state["content_hash"] = digest_hash
+    project_state.pop("pending", None)
+
+
+# --------------------------------------------------------------------
+# MODES
+# --------------------------------------------------------------------
+def run_live(projects_dir: Path, digests_dir: Path, concurrency: int, client=None) -> int:
+    """
+    Calls the chat API directly, with at most `concurrency` projects in flight.
+    """
+    if client is None:
+        from openai import OpenAI
+
+        client = OpenAI()
+    state = load_state(digests_dir)
+    jobs = plan_jobs(projects_dir, state)
+    state_lock = threading.Lock()
+
+    def process(job: dict) -> None:
+        outputs = {}
+        for part, request in build_requests(job).items():
+            response = client.chat.completions.create(**request)
+            outputs[part] = response.choices[0].message.content
+        write_digest(digests_dir, job, outputs)
+        with state_lock:
+            mark_processed(state, job["project"]["key"], job["file_hashes"], job["content_hash"])
+            _write_json(digests_dir / STATE_FILE_NAME, state)
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(process, job): job["project"]["key"] for job in jobs}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                future.result()
+                print(f"done {key}")
+            except Exception as exc:  # keep going; the project is retried next run
+                failures += 1
+                print(f"failed {key}: {exc}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+def export_batch(projects_dir: Path, digests_dir: Path, out_path: Path) -> int:
+    """
+    Writes a JSONL file in the OpenAI Batch API input format and records
+    the exported projects as pending. Projects already pending in another
+    batch file are skipped; projects pending in out_path are written again,
+    so re-running the same export never loses requests.
+    """
+    state = load_state(digests_dir)
+    out_path = out_path.resolve()
+    exported = []
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for job in plan_jobs(projects_dir, state):
+            key = job["project"]["key"]
+            pending = state.get(key, {}).get("pending")
+            if (
+                pending
+                and pending["content_hash"] == job["content_hash"]
+                and Path(pending["batch_file"]).resolve() != out_path
+            ):
+                print(f"skip {key}: already pending in {pending['batch_file']}")
+                continue
+
+            for part, body in build_requests(job).items():
+                line = {
+                    # The content hash ties each result to the export it came from
+                    "custom_id": f"{key}::{job['content_hash']}::{part}",
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                }
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            exported.append(job)
+
+    # Only mark projects as pending once the batch file is complete on disk
+    os.replace(tmp_path, out_path)
+    for job in exported:
+        state.setdefault(job["project"]["key"], {})["pending"] = {
+            "batch_file": str(out_path),
+            "content_hash": job["content_hash"],
+            "project": {k: v for k, v in job["project"].items() if k != "communications_dir"},
+            "files": job["files"],
+            "file_hashes": job["file_hashes"],
+        }
+    if exported:
+        _write_json(digests_dir / STATE_FILE_NAME, state)
+
+    print(f"exported {len(exported)} project(s) to {out_path}")
+    return 0
+
+
+def ingest_batch(results_path: Path, digests_dir: Path) -> int:
+    """
+    Reads a Batch API output JSONL file and writes digests for every pending
+    project whose summary and script both came back successfully.
+    Results from an older export of a project (different content hash) are ignored.
+    Returns 1 if any result line failed or any project came back incomplete.
+    """
+    state = load_state(digests_dir)
+    outputs: dict[tuple[str, str], dict] = {}
+    failures = 0
+
+    with open(results_path, encoding="utf-8") as results:
+        for raw in results:
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            try:
+                key, digest_hash, part = line["custom_id"].split("::")
+            except ValueError:
+                failures += 1
+                print(f"skip {line['custom_id']}: unrecognised custom_id", file=sys.stderr)
+                continue
+            outputs.setdefault((key, digest_hash), {})
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                failures += 1
+                print(f"failed {line['custom_id']}: {line.get('error')}", file=sys.stderr)
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            outputs[(key, digest_hash)][part] = content
+
+    for (key, digest_hash), project_outputs in outputs.items():
+        pending = state.get(key, {}).get("pending")
+        if not pending:
+            print(f"skip {key}: not pending")
+            continue
+        if pending["content_hash"] != digest_hash:
+            print(f"skip {key}: results are from an older export than {pending['batch_file']}")
+            continue
+        if any(part not in project_outputs for part in PARTS):
+            failures += 1
+            print(f"incomplete {key}: left pending", file=sys.stderr)
+            continue
+
+        job = {
+            "project": pending["project"],
+            "files": pending["files"],
+            "content_hash": pending["content_hash"],
+        }
+        write_digest(digests_dir, job, project_outputs)
+        mark_processed(state, key, pending["file_hashes"], pending["content_hash"])
+        _write_json(digests_dir / STATE_FILE_NAME, state)
+        print(f"done {key}")
+
+    return 1 if failures else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate nightly AI digests for all active projects.")
+    parser.add_argument("--projects-dir", type=Path, default=PROJECTS_DIR)
+    parser.add_argument("--digests-dir", type=Path, default=DIGESTS_DIR)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    run_parser = sub.add_parser("run", help="call the API directly with bounded concurrency")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="projects processed in parallel")
+
+    export_parser = sub.add_parser("export", help="write a JSONL batch input file")
+    export_parser.add_argument("out", type=Path)
+
+    ingest_parser = sub.add_parser("ingest", help="load a JSONL batch output file")
+    ingest_parser.add_argument("results", type=Path)
+
+    args = parser.parse_args(argv)
+
+    if args.mode == "run":
+        return run_live(args.projects_dir, args.digests_dir, args.concurrency)
+    if args.mode == "export":
+        return export_batch(args.projects_dir, args.digests_dir, args.out)
+    return ingest_batch(args.results, args.digests_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import batch_digest
+
+
+def add_project(projects_dir, folder, name, files):
+    project_dir = projects_dir / folder
+    (project_dir / "communications").mkdir(parents=True, exist_ok=True)
+    (project_dir / "project.json").write_text(
+        json.dumps({"name": name, "type": "System rollout", "phase": "Pilot"}), encoding="utf-8"
+    )
+    for file_name, text in files.items():
+        (project_dir / "communications" / file_name).write_text(text, encoding="utf-8")
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def batch_results(batch_file, fail=()):
+    """Fake Batch API output for every request in batch_file; custom_ids in `fail` error out."""
+    results = []
+    for line in read_lines(batch_file):
+        custom_id = line["custom_id"]
+        if custom_id in fail:
+            results.append({"custom_id": custom_id, "response": None, "error": {"message": "boom"}})
+        else:
+            body = {"choices": [{"message": {"content": f"output for {custom_id}"}}]}
+            results.append({"custom_id": custom_id, "response": {"status_code": 200, "body": body}, "error": None})
+    return results
+
+
+def write_results(path, results):
+    path.write_text("".join(json.dumps(r) + "\n" for r in results), encoding="utf-8")
+    return path
+
+
+class FakeClient:
+    def __init__(self, fail_projects=()):
+        self.fail_projects = set(fail_projects)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **request):
+        self.calls += 1
+        user_message = request["messages"][1]["content"]
+        if any(name in user_message for name in self.fail_projects):
+            raise RuntimeError("API unavailable")
+        message = SimpleNamespace(content=f"reply ({request['max_tokens']} tokens)")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    projects_dir = tmp_path / "projects"
+    digests_dir = tmp_path / "digests"
+    add_project(projects_dir, "alpha", "Alpha", {"1.txt": "team is worried"})
+    add_project(projects_dir, "beta", "Beta", {"1.txt": "rollout delayed"})
+    return projects_dir, digests_dir
+
+
+def state_for(digests_dir, name):
+    return batch_digest.load_state(digests_dir).get(batch_digest.project_key(name), {})
+
+
+def test_project_key_keeps_non_latin_names_apart():
+    assert batch_digest.project_key("财务系统上线") != batch_digest.project_key("组织重组")
+    assert batch_digest.project_key("Finance System Rollout").startswith("finance-system-rollout-")
+
+
+def test_duplicate_project_names_fail_loudly(dirs):
+    projects_dir, _ = dirs
+    add_project(projects_dir, "alpha-copy", "Alpha", {})
+    with pytest.raises(ValueError, match="Alpha|alpha"):
+        batch_digest.load_projects(projects_dir)
+
+
+def test_export_then_ingest_writes_digests(dirs, tmp_path):
+    projects_dir, digests_dir = dirs
+    out = tmp_path / "out.jsonl"
+
+    assert batch_digest.export_batch(projects_dir, digests_dir, out) == 0
+    assert len(read_lines(out)) == 4
+    assert state_for(digests_dir, "Alpha")["pending"]["batch_file"] == str(out.resolve())
+
+    results = write_results(tmp_path / "results.jsonl", batch_results(out))
+    assert batch_digest.ingest_batch(results, digests_dir) == 0
+
+    digest = batch_digest.load_digest("Alpha", digests_dir)
+    assert digest["sources"] == ["1.txt"]
+    assert "pending" not in state_for(digests_dir, "Alpha")
+
+    # Everything has been summarised, so nothing is exported again
+    batch_digest.export_batch(projects_dir, digests_dir, tmp_path / "next.jsonl")
+    assert read_lines(tmp_path / "next.jsonl") == []
+
+
+def test_reexport_to_same_file_keeps_pending_requests(dirs, tmp_path, monkeypatch):
+    projects_dir, digests_dir = dirs
+    out = tmp_path / "out.jsonl"
+    batch_digest.export_batch(projects_dir, digests_dir, out)
+
+    # Same file through a different spelling of the path
+    monkeypatch.chdir(tmp_path)
+    batch_digest.export_batch(projects_dir, digests_dir, out.relative_to(tmp_path))
+    batch_digest.export_batch(projects_dir, digests_dir, out)
+
+    assert len(read_lines(out)) == 4
+
+
+def test_export_to_second_file_skips_projects_pending_elsewhere(dirs, tmp_path):
+    projects_dir, digests_dir = dirs
+    batch_digest.export_batch(projects_dir, digests_dir, tmp_path / "out.jsonl")
+    batch_digest.export_batch(projects_dir, digests_dir, tmp_path / "other.jsonl")
+
+    assert read_lines(tmp_path / "other.jsonl") == []
+    assert len(read_lines(tmp_path / "out.jsonl")) == 4
+
+
+def test_stale_results_are_ignored_after_new_communications(dirs, tmp_path):
+    projects_dir, digests_dir = dirs
+    first = tmp_path / "out.jsonl"
+    batch_digest.export_batch(projects_dir, digests_dir, first)
+
+    (projects_dir / "alpha" / "communications" / "2.txt").write_text("people refuse", encoding="utf-8")
+    second = tmp_path / "out2.jsonl"
+    batch_digest.export_batch(projects_dir, digests_dir, second)
+    assert {line["custom_id"].split("::")[0] for line in read_lines(second)} == {
+        batch_digest.project_key("Alpha")
+    }
+
+    batch_digest.ingest_batch(write_results(tmp_path / "r1.jsonl", batch_results(first)), digests_dir)
+    assert batch_digest.load_digest("Alpha", digests_dir) is None
+    assert batch_digest.load_digest("Beta", digests_dir) is not None
+    assert "pending" in state_for(digests_dir, "Alpha")
+
+    batch_digest.ingest_batch(write_results(tmp_path / "r2.jsonl", batch_results(second)), digests_dir)
+    assert batch_digest.load_digest("Alpha", digests_dir)["sources"] == ["1.txt", "2.txt"]
+
+
+def test_failed_and_partial_results_leave_project_pending(dirs, tmp_path):
+    projects_dir, digests_dir = dirs
+    out = tmp_path / "out.jsonl"
+    batch_digest.export_batch(projects_dir, digests_dir, out)
+
+    alpha_ids = [line["custom_id"] for line in read_lines(out) if line["custom_id"].startswith("alpha-")]
+    # Alpha fails completely; Beta returns only its summary
+    results = [
+        r for r in batch_results(out, fail=alpha_ids)
+        if not (r["custom_id"].startswith("beta-") and r["custom_id"].endswith("::script"))
+    ]
+    assert batch_digest.ingest_batch(write_results(tmp_path / "r.jsonl", results), digests_dir) == 1
+
+    assert "pending" in state_for(digests_dir, "Alpha")
+    assert "pending" in state_for(digests_dir, "Beta")
+    assert batch_digest.load_digest("Alpha", digests_dir) is None
+    assert batch_digest.load_digest("Beta", digests_dir) is None
+
+
+def test_copied_files_with_old_mtime_are_picked_up(dirs, tmp_path):
+    projects_dir, digests_dir = dirs
+    assert batch_digest.run_live(projects_dir, digests_dir, 2, client=FakeClient()) == 0
+
+    old_file = projects_dir / "alpha" / "communications" / "archive.txt"
+    old_file.write_text("people complain", encoding="utf-8")
+    os.utime(old_file, (0, 0))
+
+    client = FakeClient()
+    assert batch_digest.run_live(projects_dir, digests_dir, 2, client=client) == 0
+    assert client.calls == 2
+    assert batch_digest.load_digest("Alpha", digests_dir)["sources"] == ["archive.txt"]
+
+
+def test_live_run_resumes_failed_project(dirs):
+    projects_dir, digests_dir = dirs
+
+    assert batch_digest.run_live(projects_dir, digests_dir, 2, client=FakeClient(fail_projects={"Alpha"})) == 1
+    assert batch_digest.load_digest("Alpha", digests_dir) is None
+    assert batch_digest.load_digest("Beta", digests_dir) is not None
+
+    client = FakeClient()
+    assert batch_digest.run_live(projects_dir, digests_dir, 2, client=client) == 0
+    assert client.calls == 2  # only Alpha is retried
+    assert batch_digest.load_digest("Alpha", digests_dir)["sources"] == ["1.txt"]